@@ -1,51 +1,128 @@
-from dataclasses import dataclass
+import asyncio
+import io
 import os
-from typing import TypedDict
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from functools import cache
+from typing import Annotated, TypedDict
 
 import dotenv
 import marimo
+import msgspec
 import pydantic
 import weave
 from langchain.chat_models import init_chat_model
 from langchain_core.runnables import RunnableConfig
+from langchain_openai import OpenAIEmbeddings
 from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
+
+from midiagent.batching import MicroBatcher
 from midiagent.constants import MIDI_EVENT_TO_HEX, TIME_SIGNATURE_BEATS_PER_MEASURE
+from midiagent.plan_cache import PlanCache
 from midiagent.types import Key, MidiEventType, TimeSignature
 
+# ==========================================================================
+# Environment
+# ==========================================================================
+
+
+def _require_env(*names: str) -> None:
+    for name in names:
+        if not os.getenv(name):
+            raise Exception(f'Missing environment variable "{name}"')
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true")
+
+
+@cache
+def _load_env() -> None:
+    """Load .env once. Only reads a local file, so unlike `_init_env` it's fine to call on the event loop."""
+    dotenv.load_dotenv()
+
+
+@cache
+def _init_env() -> None:
+    """Load .env and start W&B tracing. Deferred to first use so importing this module stays cheap."""
+    _load_env()
+    _require_env("PROJECT_ID", "WANDB_API_KEY")
+    weave.init(os.environ["PROJECT_ID"])
+
 
-dotenv.load_dotenv()
-if not os.getenv("PROJECT_ID"):
-    raise Exception('Missing environment variable "PROJECT_ID"')
+_init_env_lock = threading.Lock()
 
-if not os.getenv("WANDB_API_KEY"):
-    raise Exception('Missing environment variable "WANDB_API_KEY"')
 
-weave.init(os.environ["PROJECT_ID"])
+def _init_env_locked() -> None:
+    # functools.cache doesn't stop concurrent first calls from initializing twice
+    with _init_env_lock:
+        _init_env()
+
+
+async def _ainit_env() -> None:
+    """Run `_init_env` on a worker thread, so the W&B handshake on first use doesn't block the event loop."""
+    if not _init_env.cache_info().currsize:
+        await asyncio.to_thread(_init_env_locked)
+
 
 # ==========================================================================
-# Pydantic schemas
+# Schemas
 # ==========================================================================
 
 
-class SparseMidiEvent(pydantic.BaseModel):
+class SparseMidiEvent(msgspec.Struct, kw_only=True, frozen=True, forbid_unknown_fields=True):
     """
     A MIDI event (note or CC) at a given point in time.
     Measure, beat, beat_div4, & beat_div16 collectively specify the timing.
     If unspecified, timing fields are assumed unchanged from the previous event, resetting to "1" whenever their parent is updated.
     """
 
-    measure: int | None = pydantic.Field(None, gt=0, description="The measure, starting from 1.")
-    beat: int | None = pydantic.Field(None, gt=0, lt=9, description="The beat within the measure, starting from 1 (quarter notes in */4 time).")
-    beat_div4: int | None = pydantic.Field(None, gt=0, lt=9, description="Divides the beat into quarters (16th notes in */4 time).")
-    beat_div16: int | None = pydantic.Field(None, gt=0, lt=9, description="Divides the beat into 16ths (64th notes in */4 time).")
-    event: MidiEventType = pydantic.Field(description="Human-readable representation of a MIDI note or CC event. Use the provided schema.")
-    value: int = pydantic.Field(gt=-1, lt=101, description="The value of a CC event, or the velocity of a note event, scaled 0-100 (inclusive).")
-
-
-@dataclass
+    measure: Annotated[int, msgspec.Meta(gt=0, description="The measure, starting from 1.")] | None = None
+    beat: (
+        Annotated[
+            int,
+            msgspec.Meta(
+                gt=0, lt=9, description="The beat within the measure, starting from 1 (quarter notes in */4 time)."
+            ),
+        ]
+        | None
+    ) = None
+    beat_div4: (
+        Annotated[int, msgspec.Meta(gt=0, lt=9, description="Divides the beat into quarters (16th notes in */4 time).")]
+        | None
+    ) = None
+    beat_div16: (
+        Annotated[int, msgspec.Meta(gt=0, lt=9, description="Divides the beat into 16ths (64th notes in */4 time).")]
+        | None
+    ) = None
+    event: Annotated[
+        MidiEventType,
+        msgspec.Meta(description="Human-readable representation of a MIDI note or CC event. Use the provided schema."),
+    ]
+    value: Annotated[
+        int,
+        msgspec.Meta(
+            gt=-1,
+            lt=101,
+            description="The value of a CC event, or the velocity of a note event, scaled 0-100 (inclusive).",
+        ),
+    ]
+
+
+@dataclass(slots=True)
 class MidiEvent:
-    """Clone of SparseMidiEvent with required fields."""
+    """
+    Clone of SparseMidiEvent with required fields.
+    A plain dataclass rather than a schema: it is only built from already-validated events, so it skips validation.
+    """
+
     measure: int
     beat: int
     beat_div4: int
@@ -53,74 +130,194 @@ class MidiEvent:
     event: MidiEventType
     value: int
 
-    def timestamp(self, bpm: int, time_signature: TimeSignature) -> float:
-        """Return the timestamp of the event in seconds, relative to the start of playback."""
-        beats_per_measure = TIME_SIGNATURE_BEATS_PER_MEASURE[time_signature]
-        seconds_per_beat = 60 / bpm
-        seconds_per_div4 = seconds_per_beat / 4
-        seconds_per_div16 = seconds_per_div4 / 4
-        seconds_per_measure = seconds_per_beat * beats_per_measure
-        return sum(
-            [
-            (self.measure - 1) * seconds_per_measure,
-            (self.beat - 1) * seconds_per_beat,
-            ((self.beat_div4 - 1) * seconds_per_div4),
-            ((self.beat_div16 - 1) * seconds_per_div16),
-        ])
-    
-    def payload(self) -> tuple[int, int, int]:
-        status_byte, data_byte_1 = MIDI_EVENT_TO_HEX[self.event]
-        data_byte_2 = self.value
-        return (status_byte, data_byte_1, data_byte_2)
-
 
 class PlanResponse(pydantic.BaseModel):
     """
     High-level musical decisions before MIDI generation.
     """
 
+    model_config = pydantic.ConfigDict(frozen=True, extra="forbid", revalidate_instances="never")
+
     key: Key = pydantic.Field(description="The musical key for the composition")
     bpm: int = pydantic.Field(gt=29, lt=361, description="Tempo in beats-per-minute, 30-360")
     time_signature: TimeSignature = pydantic.Field(description="Time signature for the piece")
     style: str = pydantic.Field(description="Brief description of the musical style/feel")
-    chord_progression: list[str] = pydantic.Field(
-        description="Chord progression using chord symbols (e.g. ['Gbm7', 'D', 'Em', 'C'])"
+    # A tuple rather than a list so frozen plans stay hashable
+    chord_progression: tuple[str, ...] = pydantic.Field(
+        min_length=1,
+        description=(
+            "Chord progression using chord symbols (e.g. ['Gbm7', 'D', 'Em', 'C']), one chord per measure. "
+            "Repeat the progression to fill the requested length."
+        ),
     )
     reasoning: str = pydantic.Field(description="Explanation of musical choices for evaluation")
 
 
-class DslResponse(pydantic.BaseModel):
+class PlanBatchResponse(pydantic.BaseModel):
+    """
+    Plans for several independent requests, answered in one call.
+    """
+
+    model_config = pydantic.ConfigDict(frozen=True, extra="forbid", revalidate_instances="never")
+
+    plans: list[PlanResponse] = pydantic.Field(description="One plan per request, in the same order as the requests")
+
+
+class DslResponse(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
     """Final response schema with full MIDI events."""
+
     dsl: list[SparseMidiEvent]
 
     def get_midi_events(self) -> list[MidiEvent]:
-        result: list[MidiEvent] = []
+        """
+        Resolve sparse timings into absolute MidiEvents.
+        Events from the LLM are trusted once the response as a whole has validated, so no field is re-checked here.
+        """
+        # Preallocated and filled by index to avoid resizing while appending
+        result: list = [None] * len(self.dsl)
 
         measure = 1
         beat = 1
         beat_div4 = 1
         beat_div16 = 1
 
-        for item in self.dsl:
-            if item.measure and item.measure != measure:
-                measure = item.measure
-                beat = 1
-                beat_div4 = 1
-                beat_div16 = 1
-            if item.beat and item.beat != beat:
-                beat = item.beat
-                beat_div4 = 1
-                beat_div16 = 1
-            if item.beat_div4 and item.beat_div4 != beat_div4:
-                beat_div4 = item.beat_div4
-                beat_div16 = 1
-            if item.beat_div16 and item.beat_div16 != beat_div16:
-                beat_div16 = item.beat_div16
-
-            result.append(MidiEvent(measure=measure, beat=beat, beat_div4=beat_div4, beat_div16=beat_div16, event=item.event, value=item.value))
+        # Each level takes the event's value if given (else carries over), and resets the levels below it on change
+        for idx, item in enumerate(self.dsl):
+            new_measure = item.measure or measure
+            if new_measure != measure:
+                measure, beat, beat_div4, beat_div16 = new_measure, 1, 1, 1
+            new_beat = item.beat or beat
+            if new_beat != beat:
+                beat, beat_div4, beat_div16 = new_beat, 1, 1
+            new_beat_div4 = item.beat_div4 or beat_div4
+            if new_beat_div4 != beat_div4:
+                beat_div4, beat_div16 = new_beat_div4, 1
+            beat_div16 = item.beat_div16 or beat_div16
+
+            # Positional args skip the keyword-matching overhead of the dataclass __init__
+            result[idx] = MidiEvent(measure, beat, beat_div4, beat_div16, item.event, item.value)
 
         return result
 
+    def get_playback_events(self, bpm: int, time_signature: TimeSignature) -> list[tuple[int, int, int, float]]:
+        """
+        Resolve the events into (status, data1, data2, time_ms) tuples, in DSL order, ready to hand to the MIDI widget.
+        Each time is counted in 16th-of-a-beat steps and scaled once, rather than summing per-level seconds per event.
+        """
+        ms_per_div16 = 60_000 / bpm / 16
+        div16_per_measure = TIME_SIGNATURE_BEATS_PER_MEASURE[time_signature] * 16
+        event_to_hex = MIDI_EVENT_TO_HEX
+
+        result: list = [None] * len(self.dsl)
+        for idx, event in enumerate(self.get_midi_events()):
+            status_byte, data_byte_1 = event_to_hex[event.event]
+            div16 = (
+                (event.measure - 1) * div16_per_measure
+                + (event.beat - 1) * 16
+                + (event.beat_div4 - 1) * 4
+                + (event.beat_div16 - 1)
+            )
+            result[idx] = (status_byte, data_byte_1, event.value, div16 * ms_per_div16)
+
+        return result
+
+    def format_dsl(self) -> str:
+        """Render the events one per line as `measure-beat-div4-div16 event: value`, with X for unset timings."""
+        # Written into one buffer rather than joining a list of per-event lines. The line is formatted inline
+        # because msgspec fields are plain slot reads, so a formatter call (or an attrgetter) is the costlier part.
+        buffer = io.StringIO()
+        write = buffer.write
+        for idx, e in enumerate(self.dsl):
+            if idx:
+                write("\n")
+            write(f"{e.measure or 'X'}-{e.beat or 'X'}-{e.beat_div4 or 'X'}-{e.beat_div16 or 'X'} {e.event}: {e.value}")
+        return buffer.getvalue()
+
+
+def _inline_json_schema(struct_type: type[msgspec.Struct]) -> dict:
+    """
+    Return the JSON schema for a msgspec Struct with the top-level definition inlined.
+    Tool schemas must be an object at the root, but msgspec emits a root "$ref" into "$defs".
+    """
+    schema = msgspec.json.schema(struct_type)
+    defs = schema["$defs"]
+    root = defs.pop(schema["$ref"].rsplit("/", 1)[-1])
+    if defs:
+        root["$defs"] = defs
+    return root
+
+
+DSL_RESPONSE_SCHEMA = _inline_json_schema(DslResponse)
+_DSL_DECODER = msgspec.json.Decoder(DslResponse)
+
+
+_EVENT_DECODER = msgspec.json.Decoder(SparseMidiEvent)
+
+
+class _DslEventScanner:
+    """
+    Pulls complete events out of a DslResponse's JSON as it streams in.
+    Only closed event objects are decoded, so a number cut off mid-token (`"value": 8` on its way to 80) never
+    shows up as a partial event, and each chunk is scanned once rather than re-parsing everything received so far.
+    """
+
+    # Depth of an event object: the response object, then its `dsl` array
+    _EVENT_DEPTH = 3
+
+    def __init__(self) -> None:
+        self.events: list[SparseMidiEvent] = []
+        self._chunks: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # Pieces of an event object that started in an earlier chunk, or None outside of one
+        self._event_parts: list[str] | None = None
+
+    @property
+    def raw(self) -> str:
+        """Everything received so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> int:
+        """Scan the next chunk of raw JSON, returning how many events it completed."""
+        self._chunks.append(chunk)
+        completed = 0
+        event_start = 0
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{" or char == "[":
+                self._depth += 1
+                if char == "{" and self._depth == self._EVENT_DEPTH:
+                    self._event_parts = []
+                    event_start = i
+            elif char == "}" or char == "]":
+                if char == "}" and self._depth == self._EVENT_DEPTH and self._event_parts is not None:
+                    self._event_parts.append(chunk[event_start : i + 1])
+                    self.events.append(_EVENT_DECODER.decode("".join(self._event_parts)))
+                    self._event_parts = None
+                    completed += 1
+                self._depth -= 1
+
+        if self._event_parts is not None:
+            # The open event continues into the next chunk, from its start
+            self._event_parts.append(chunk[event_start:])
+        return completed
+
+
+# Built once at import and reused for every plan, whether it came from the LLM or the plan cache
+_PLAN_ADAPTER = pydantic.TypeAdapter(PlanResponse)
+PLAN_RESPONSE_SCHEMA = _PLAN_ADAPTER.json_schema()
+_PLAN_BATCH_ADAPTER = pydantic.TypeAdapter(PlanBatchResponse)
+PLAN_BATCH_RESPONSE_SCHEMA = _PLAN_BATCH_ADAPTER.json_schema()
+
 
 # ==========================================================================
 # Graph state
@@ -165,12 +362,14 @@ Your job is to analyze a user's musical request and create a high-level plan tha
 - The appropriate key for the piece
 - A suitable tempo (BPM)
 - The time signature
-- A chord progression that fits the style
+- A chord progression that fits the style, with one chord per measure
 - A brief description of the style/feel
 
 Be thoughtful about your choices. Consider the mood, genre, and any specific requests the user made.
 Explain your reasoning so your choices can be evaluated.
 
+The piece is exactly one measure per chord, so the chord progression sets its length. If the user asks for a length (e.g. "16 bars"), repeat the progression to fill it: a I-V-vi-IV progression for 16 bars is those four chords four times over. Otherwise, write the progression once.
+
 Examples of good reasoning:
 - "The user requested 'bouncy piano' which suggests an upbeat feel. I chose 120 BPM in G major with a I-V-vi-IV progression for its bright, accessible sound."
 - "For a melancholic ballad, I selected D minor at 72 BPM with a i-VI-III-VII progression to create emotional depth."
@@ -196,37 +395,92 @@ Each SparseMidiEvent has:
 
 Generate a musically coherent sequence that realizes the plan."""
 
+
+def _cached_system_message(prompt: str) -> dict:
+    """
+    Wrap a static system prompt as an Anthropic cache breakpoint.
+    The prefix up to it (tool schema + system prompt) is then reused across requests instead of being prefilled each time.
+    """
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}],
+    }
+
+
+PLANNING_SYSTEM_MESSAGE = _cached_system_message(PLANNING_PROMPT)
+GENERATION_SYSTEM_MESSAGE = _cached_system_message(GENERATION_PROMPT)
+
 # ==========================================================================
 # Pipeline nodes
 # ==========================================================================
 
-if not os.getenv("ANTHROPIC_API_KEY"):
-    raise Exception('Missing environment variable "ANTHROPIC_API_KEY"')
+PLANNING_BATCH_SIZE = 8
+PLANNING_BATCH_WINDOW = 0.05  # seconds
+# Most measures the generation node requests at once, so long progressions don't fire one LLM call per chord at once
+GENERATION_CONCURRENCY = 8
 
-# Initialize models with structured output
-planning_model = init_chat_model("claude-haiku-4-5", model_provider="anthropic").with_structured_output(PlanResponse)
-generation_model = init_chat_model("claude-haiku-4-5", model_provider="anthropic").with_structured_output(DslResponse)
 
+@cache
+def _planning_model():
+    _init_env()
+    _require_env("ANTHROPIC_API_KEY")
+    return init_chat_model("claude-haiku-4-5", model_provider="anthropic").with_structured_output(PLAN_RESPONSE_SCHEMA)
 
 
-def planning_node(state: PipelineState, config: RunnableConfig) -> PlanningNodeOutput:
-    """Stage 1: Analyze user request and create a musical plan."""
-    # Build constraint info for the prompt from state
-    constraints = []
-    if state.get("key"):
-        constraints.append(f"Musical Key: {state['key']} (REQUIRED - use this exact key unless the user explicitly requests another)")
-    if state.get("time_signature"):
-        constraints.append(f"Time Signature: {state['time_signature']} (REQUIRED - use this exact time signature unless the user explicitly requests another)")
-    if state.get("bpm"):
-        constraints.append(f"BPM: {state['bpm']} (REQUIRED - use this exact tempo unless the user explicitly requests another)")
+@cache
+def _planning_batch_model():
+    _init_env()
+    _require_env("ANTHROPIC_API_KEY")
+    return init_chat_model("claude-haiku-4-5", model_provider="anthropic").with_structured_output(
+        PLAN_BATCH_RESPONSE_SCHEMA
+    )
+
+
+@cache
+def _planning_batcher() -> MicroBatcher[tuple[PipelineState, RunnableConfig], PlanResponse]:
+    """Planning prompts are small, so concurrent requests are packed into shared LLM calls."""
+    return MicroBatcher(_plan_batch, max_size=PLANNING_BATCH_SIZE, max_wait=PLANNING_BATCH_WINDOW)
+
+
+@cache
+def _generation_model():
+    _init_env()
+    _require_env("ANTHROPIC_API_KEY")
+    # The DSL response can hold hundreds of events, so rather than going through LangChain's structured output parser,
+    # the forced tool call's raw JSON is decoded straight into Structs by msgspec
+    return init_chat_model("claude-haiku-4-5", model_provider="anthropic").bind_tools(
+        [DSL_RESPONSE_SCHEMA], tool_choice=DSL_RESPONSE_SCHEMA["title"]
+    )
+
+
+@cache
+def _plan_cache() -> PlanCache | None:
+    """Optionally reuse plans from earlier near-identical requests instead of re-running the planning LLM."""
+    _init_env()
+    if not _env_flag("PLAN_CACHE_ENABLED"):
+        return None
+    _require_env("OPENAI_API_KEY")
+    return PlanCache(
+        os.getenv("PLAN_CACHE_PATH", ".plan_cache.sqlite3"),
+        OpenAIEmbeddings(model="text-embedding-3-small"),
+    )
 
-    user_content = state["user_request"]
-    if constraints:
-        user_content += "\n\nUser constraints (you MUST use these values):\n" + "\n".join(constraints)
 
-    messages = [{"role": "system", "content": PLANNING_PROMPT}, {"role": "user", "content": user_content}]
-    plan: PlanResponse = planning_model.invoke(messages, config)
-    
+async def planning_node(state: PipelineState, config: RunnableConfig) -> PlanningNodeOutput:
+    """Stage 1: Analyze user request and create a musical plan."""
+    plan: PlanResponse | None = None
+    plan_cache = _plan_cache()
+    requested = (state.get("key"), state.get("bpm"), state.get("time_signature"))
+    if plan_cache:
+        embedding, cached_plan = await plan_cache.lookup(state["user_request"], requested)
+        if cached_plan:
+            plan = _PLAN_ADAPTER.validate_json(cached_plan)
+
+    if plan is None:
+        plan = await _planning_batcher().submit((state, config))
+        if plan_cache:
+            await plan_cache.store(embedding, requested, plan.model_dump_json())
+
     # Update state with both the plan and the LLM's chosen values
     return {
         "plan": plan,
@@ -236,12 +490,117 @@ def planning_node(state: PipelineState, config: RunnableConfig) -> PlanningNodeO
     }
 
 
-def generation_node(state: PipelineState, config: RunnableConfig) -> GenerationNodeOutput:
+async def _plan_batch(requests: list[tuple[PipelineState, RunnableConfig]]) -> list[PlanResponse]:
+    """Plan a batch of requests, using a plain planning call when there's only one."""
+    # Batched calls are traced under the first request's config
+    config = requests[0][1]
+    if len(requests) == 1:
+        messages = [PLANNING_SYSTEM_MESSAGE, {"role": "user", "content": _planning_request(requests[0][0])}]
+        args = await _planning_model().ainvoke(messages, config)
+        return [_PLAN_ADAPTER.validate_python(args)]
+
+    user_content = "\n\n".join(
+        (
+            f"Plan each of the following {len(requests)} requests independently. "
+            "Return exactly one plan per request, in the same order.",
+            *(f"Request {idx}:\n{_planning_request(state)}" for idx, (state, _) in enumerate(requests, start=1)),
+        )
+    )
+    args = await _planning_batch_model().ainvoke(
+        [PLANNING_SYSTEM_MESSAGE, {"role": "user", "content": user_content}], config
+    )
+    return _PLAN_BATCH_ADAPTER.validate_python(args).plans
+
+
+_CONSTRAINTS_HEADER = "\n\nUser constraints (you MUST use these values):\n"
+_REQUIRED_KEY = " (REQUIRED - use this exact key unless the user explicitly requests another)"
+_REQUIRED_TS = " (REQUIRED - use this exact time signature unless the user explicitly requests another)"
+_REQUIRED_BPM = " (REQUIRED - use this exact tempo unless the user explicitly requests another)"
+
+
+def _planning_request(state: PipelineState) -> str:
+    """Build the planning prompt, including any user constraints from state."""
+    key, time_signature, bpm = state.get("key"), state.get("time_signature"), state.get("bpm")
+    constraints = tuple(
+        line
+        for line in (
+            key and f"Musical Key: {key}{_REQUIRED_KEY}",
+            time_signature and f"Time Signature: {time_signature}{_REQUIRED_TS}",
+            bpm and f"BPM: {bpm}{_REQUIRED_BPM}",
+        )
+        if line
+    )
+
+    user_content = state["user_request"]
+    if constraints:
+        user_content = "".join((user_content, _CONSTRAINTS_HEADER, "\n".join(constraints)))
+
+    return user_content
+
+
+async def generation_node(state: PipelineState, config: RunnableConfig) -> GenerationNodeOutput:
     """
     Stage 2: Generate MIDI events based on the musical plan.
+    Each chord in the progression is generated as its own measure, up to GENERATION_CONCURRENCY at a time,
+    then merged in order. If any measure fails, the rest are cancelled.
     """
     plan = state["plan"]
-    generation_request = f"""Generate MIDI events for this musical plan:
+    writer = get_stream_writer()
+    segments: list[list[SparseMidiEvent]] = [[] for _ in plan.chord_progression]
+    finished = [False] * len(segments)
+    limit = asyncio.Semaphore(GENERATION_CONCURRENCY)
+    # Streamed events go out in their final order: the earliest unfinished segment streams as it goes,
+    # and later segments are held back until every segment before them is done
+    frontier = 0
+    published = 0
+
+    def publish() -> None:
+        nonlocal frontier, published
+        events: list[SparseMidiEvent] = []
+        while frontier < len(segments):
+            segment = segments[frontier]
+            events += segment[published:]
+            if not finished[frontier]:
+                published = len(segment)
+                break
+            frontier += 1
+            published = 0
+        if events:
+            writer({"events": events})
+
+    async def generate_segment(idx: int) -> None:
+        messages = [GENERATION_SYSTEM_MESSAGE, {"role": "user", "content": _segment_request(state, idx)}]
+
+        async with limit:
+            # Stream the segment's events as each one completes so callers can render them before the LLM finishes
+            scanner = _DslEventScanner()
+            async for chunk in _generation_model().astream(messages, config):
+                if completed := scanner.feed("".join(tool_call["args"] or "" for tool_call in chunk.tool_call_chunks)):
+                    segments[idx] += _rebase_segment(scanner.events[-completed:], idx, pin_first=not segments[idx])
+                    if idx == frontier:
+                        publish()
+
+        # The complete output is decoded straight from its raw JSON and must validate
+        segments[idx] = _rebase_segment(_DSL_DECODER.decode(scanner.raw).dsl, idx)
+        finished[idx] = True
+        if idx == frontier:
+            publish()
+
+    # Unlike gather, a TaskGroup cancels the other segments as soon as one fails
+    try:
+        async with asyncio.TaskGroup() as group:
+            for idx in range(len(segments)):
+                group.create_task(generate_segment(idx))
+    except ExceptionGroup as e:
+        # Raise the first failure itself, as gather did, rather than the group wrapping it
+        raise e.exceptions[0] from None
+    return {"response": DslResponse(dsl=[event for segment in segments for event in segment])}
+
+
+def _segment_request(state: PipelineState, idx: int) -> str:
+    """Build the generation prompt for the measure at `idx`, which realizes that chord of the progression."""
+    plan = state["plan"]
+    return f"""Generate MIDI events for one measure of this musical plan:
 
     Key: {plan.key}
     BPM: {plan.bpm}
@@ -249,11 +608,33 @@ def generation_node(state: PipelineState, config: RunnableConfig) -> GenerationN
     Style: {plan.style}
     Chord Progression: {" - ".join(plan.chord_progression)}
 
+    Write a single measure over the chord {plan.chord_progression[idx]}; the other chords are written separately.
+    Number it as measure 1: every event is in measure 1, whichever chord of the progression this is.
+    Release everything the measure starts before it ends: end each note with a value of 0, and set Sustain back to 0.
+
     Original user request: {state["user_request"]}
 """
-    messages = [{"role": "system", "content": GENERATION_PROMPT}, {"role": "user", "content": generation_request}]
-    response: DslResponse = generation_model.invoke(messages, config)
-    return {"response": response}
+
+
+def _rebase_segment(events: list[SparseMidiEvent], offset: int, pin_first: bool = True) -> list[SparseMidiEvent]:
+    """
+    Shift a single-measure segment's events forward by `offset` measures.
+    The first event's timing is pinned so nothing carries over from the end of the previous segment;
+    pass `pin_first=False` when `events` continue a segment rather than start it.
+    """
+    rebased = [
+        msgspec.structs.replace(event, measure=event.measure + offset) if event.measure else event for event in events
+    ]
+    if rebased and pin_first:
+        first = rebased[0]
+        rebased[0] = msgspec.structs.replace(
+            first,
+            measure=first.measure or offset + 1,
+            beat=first.beat or 1,
+            beat_div4=first.beat_div4 or 1,
+            beat_div16=first.beat_div16 or 1,
+        )
+    return rebased
 
 
 # ==========================================================================
@@ -271,20 +652,121 @@ workflow.add_edge(START, "planning")
 workflow.add_edge("planning", "generation")
 workflow.add_edge("generation", END)
 
-# Compile with checkpointing for state inspection
-pipeline = workflow.compile(checkpointer=InMemorySaver())
+# Checkpointing is only needed to inspect state while debugging, so the default pipeline skips it
+pipeline = workflow.compile()
+# msgspec Structs aren't msgpack-serializable, so let the checkpointer fall back to pickle for them
+checkpointed_pipeline = workflow.compile(checkpointer=InMemorySaver(serde=JsonPlusSerializer(pickle_fallback=True)))
 
 # ==========================================================================
 # Chat interface
 # ==========================================================================
 
 
+# Completed runs are memoized on the request and its constraints, so repeating a prompt skips the LLM calls.
+# Checkpointed (debug) runs skip the memo, so every one of them leaves a checkpoint to inspect.
+PIPELINE_RESULTS_SIZE = 128
+# (user_request, key, bpm, time_signature)
+_PipelineKey = tuple[str, Key | None, int | None, TimeSignature | None]
+_pipeline_results: OrderedDict[_PipelineKey, tuple[PlanResponse, DslResponse]] = OrderedDict()
+
+
+def _pipeline_key(state: PipelineState) -> _PipelineKey:
+    return (state["user_request"], state["key"], state["bpm"], state["time_signature"])
+
+
+def _cached_result(state: PipelineState) -> tuple[PlanResponse, DslResponse] | None:
+    """Return the memoized plan and response for this request, if it has been run before."""
+    key = _pipeline_key(state)
+    result = _pipeline_results.get(key)
+    if result is not None:
+        _pipeline_results.move_to_end(key)
+    return result
+
+
+def _remember_result(state: PipelineState, plan: PlanResponse, response: DslResponse) -> None:
+    """Memoize a completed run, evicting the least recently used one once the memo is full."""
+    key = _pipeline_key(state)
+    _pipeline_results[key] = (plan, response)
+    _pipeline_results.move_to_end(key)
+    if len(_pipeline_results) > PIPELINE_RESULTS_SIZE:
+        _pipeline_results.popitem(last=False)
+
+
+def debug_thread_id() -> str | None:
+    """
+    With PIPELINE_DEBUG set, a fresh thread id to checkpoint runs under for inspection; otherwise None,
+    so runs skip checkpointing. Pass the result as `thread_id` to `run_pipeline` or `stream_pipeline`,
+    reusing it for every turn of a conversation to inspect those turns together.
+    """
+    _load_env()
+    return str(uuid.uuid4()) if _env_flag("PIPELINE_DEBUG") else None
 
-def get_response(
+
+def _select_pipeline(thread_id: str | None) -> tuple[CompiledStateGraph, RunnableConfig]:
+    """Use the checkpointed pipeline only when a thread is given to checkpoint under."""
+    if thread_id is None:
+        return pipeline, {}
+    return checkpointed_pipeline, {"configurable": {"thread_id": thread_id}}
+
+
+async def run_pipeline(initial_state: PipelineState, thread_id: str | None = None) -> tuple[PlanResponse, DslResponse]:
+    """
+    Run the pipeline once and return its plan and response. Pass `thread_id` to checkpoint the run.
+    Checkpointed runs always run in full, so the memo never leaves one without a checkpoint.
+    """
+    if thread_id is None and (cached := _cached_result(initial_state)) is not None:
+        return cached
+
+    await _ainit_env()
+    compiled, config = _select_pipeline(thread_id)
+    result = await compiled.ainvoke(initial_state, config=config)
+    _remember_result(initial_state, result["plan"], result["response"])
+    return result["plan"], result["response"]
+
+
+async def stream_pipeline(
+    initial_state: PipelineState, thread_id: str | None = None
+) -> AsyncIterator[PlanResponse | list[SparseMidiEvent] | DslResponse]:
+    """
+    Run the pipeline once, yielding the plan as soon as it is ready, then each run of newly generated events
+    (in their final order, so together they make up the response), then the complete DslResponse.
+    Pass `thread_id` to checkpoint the run.
+    A request that has been run before yields its memoized plan and complete response straight away,
+    unless the run is checkpointed, which always runs in full.
+    """
+    if thread_id is None and (cached := _cached_result(initial_state)) is not None:
+        yield cached[0]
+        yield cached[1]
+        return
+
+    await _ainit_env()
+    plan: PlanResponse | None = None
+    response: DslResponse | None = None
+    compiled, config = _select_pipeline(thread_id)
+    async for mode, chunk in compiled.astream(initial_state, config=config, stream_mode=["updates", "custom"]):
+        if mode == "updates" and "planning" in chunk:
+            plan = chunk["planning"]["plan"]
+            yield plan
+        elif mode == "updates" and "generation" in chunk:
+            response = chunk["generation"]["response"]
+            yield response
+        elif mode == "custom":
+            yield chunk["events"]
+
+    if plan is not None and response is not None:
+        _remember_result(initial_state, plan, response)
+
+
+async def run_pipelines(initial_states: list[PipelineState]) -> list[tuple[PlanResponse, DslResponse]]:
+    """Run the pipeline for several independent requests concurrently."""
+    return await asyncio.gather(*(run_pipeline(state) for state in initial_states))
+
+
+async def get_response(
     messages: list[marimo.ai.ChatMessage],
     config: marimo.ai.ChatModelConfig,
-) -> tuple[PlanResponse, DslResponse]:
-    """Chat handler that uses config for constraints."""
+) -> AsyncIterator[PlanResponse | list[SparseMidiEvent] | DslResponse]:
+    """Chat handler that uses config for constraints. Yields the updates from `stream_pipeline`."""
     # Get the latest user message
     user_request = messages[-1].content if messages else ""
 
@@ -299,13 +781,7 @@ def get_response(
     }
 
     # Run the pipeline - constraints are now in state
-    result = pipeline.invoke(
-        initial_state,
-        config={"configurable": {"thread_id": "1"}},
-    )
-
-    # Extract outputs
-    plan: PlanResponse = result["plan"]
-    response: DslResponse = result["response"]
-
-    return plan, response
\ No newline at end of file
+    # Set PIPELINE_DEBUG to checkpoint each run under its own thread for inspection; this handler keeps no
+    # per-conversation state, so unlike the notebook's it can't group a conversation's turns
+    async for update in stream_pipeline(initial_state, thread_id=debug_thread_id()):
+        yield update
@@ -0,0 +1,80 @@
+import asyncio
+import contextvars
+from collections.abc import Awaitable, Callable, Coroutine
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Coalesces concurrent calls into batches of up to `max_size` items, collected over a `max_wait` second window.
+    `run_batch` receives the items in submission order and must return one result per item, in the same order.
+    A lone item with no batch in flight skips the window, since nothing else is likely to join it.
+    Each batch runs in the context of its first item's `submit` call, so that caller's LangGraph config and
+    tracing context carry over; the other items in the batch don't get their own.
+    """
+
+    def __init__(
+        self, run_batch: Callable[[list[T]], Awaitable[list[R]]], max_size: int = 8, max_wait: float = 0.05
+    ) -> None:
+        self.run_batch = run_batch
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[tuple[T, asyncio.Future[R], contextvars.Context]] | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._in_flight = 0
+
+    async def submit(self, item: T) -> R:
+        """Queue an item for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and futures are bound to a loop, so start fresh if we're now running on another one
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._in_flight = 0
+            self._spawn(self._drain(), contextvars.Context())
+
+        future: asyncio.Future[R] = loop.create_future()
+        self._queue.put_nowait((item, future, contextvars.copy_context()))
+        return await future
+
+    async def _drain(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            # Let submits made in the same tick (e.g. under asyncio.gather) land before deciding whether to wait
+            await asyncio.sleep(0)
+            if not queue.empty() or self._in_flight:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            # Run each batch in its own task so a slow LLM call doesn't hold up collecting the next one
+            self._in_flight += 1
+            self._spawn(self._flush(batch), batch[0][2])
+
+    async def _flush(self, batch: list[tuple[T, asyncio.Future[R], contextvars.Context]]) -> None:
+        items = [item for item, _, _ in batch]
+        try:
+            results = await self.run_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"Expected {len(items)} batch results, got {len(results)}")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+
+        for (_, future, _), result in zip(batch, results, strict=True):
+            if not future.done():
+                future.set_result(result)
+
+    def _spawn(self, coro: Coroutine, context: contextvars.Context) -> None:
+        # Hold a reference so pending tasks aren't garbage collected mid-flight
+        task = self._loop.create_task(coro, context=context)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -2,6 +2,7 @@ from midiagent.types import Key, MidiEventType, TimeSignature
 
 KEYS: list[Key] = ["C", "C#", "Db", "D", "D#", "Eb", "E", "F", "F#", "Gb", "G", "G#", "Ab", "A", "A#", "Bb", "B"]
 TIME_SIGNATURES: list[TimeSignature] = ["3/4", "4/4", "5/4", "6/8", "7/8"]
+BPMS: list[int] = list(range(30, 361))
 TIME_SIGNATURE_BEATS_PER_MEASURE: dict[TimeSignature, int] = {
     "3/4": 3,
     "4/4": 4,
@@ -193,4 +194,17 @@ MIDI_EVENT_TO_HEX: dict[MidiEventType, tuple[int, int]] = {
     "G9": (0x90, 127),
     "ModWheel": (0xB0, 1),
     "Sustain": (0xB0, 64),
-}
\ No newline at end of file
+}
+
+# Notes offered for manual playback in the notebook: C4 through C5
+NOTE_OPTIONS: dict[str, int] = {
+    "C4": 60,
+    "D4": 62,
+    "E4": 64,
+    "F4": 65,
+    "G4": 67,
+    "A4": 69,
+    "B4": 71,
+    "C5": 72,
+}
+NOTE_NAME_BY_MIDI: dict[int, str] = {note: name for name, note in NOTE_OPTIONS.items()}
@@ -1,21 +1,15 @@
-import time
-from midiagent.ai import MidiEvent
+from operator import itemgetter
+
+from midiagent.ai import DslResponse
 from midiagent.midi_widget import MidiWidget
 from midiagent.types import TimeSignature
 
 
-def play_midi(bpm: int, time_signature: TimeSignature, events: list[MidiEvent], midi: MidiWidget) -> None:
-    idx = 0
-    batch: list[MidiEvent] = []
-    started_at = time.time()
-
-    while idx < len(events):
-        event = events[idx]
-        elapsed = time.time() - started_at
-        event_time = event.timestamp(bpm, time_signature)
-        if event_time <= elapsed:
-            idx += 1
-            batch.append(event)
-        elif batch:
-            midi.events = [event.payload() for event in batch]
-            batch = []
+def play_midi(bpm: int, time_signature: TimeSignature, response: DslResponse, midi: MidiWidget) -> None:
+    """Hand the widget the whole timed sequence at once; the browser schedules playback from there."""
+    # One traitlet sync for the sequence instead of one per batch of simultaneous events.
+    # Sorted in place by time so the widget can send each run of equal timestamps together;
+    # the sort is stable, so events sharing a timestamp keep their DSL order.
+    events = response.get_playback_events(bpm, time_signature)
+    events.sort(key=itemgetter(3))
+    midi.send_events(events)
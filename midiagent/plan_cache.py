@@ -0,0 +1,84 @@
+import asyncio
+import math
+import operator
+import sqlite3
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from midiagent.types import Key, TimeSignature
+
+# (key, bpm, time_signature) as requested by the user, any of which may be unset
+Constraints = tuple[Key | None, int | None, TimeSignature | None]
+
+
+class PlanCache:
+    """
+    Reuses plans for requests that are semantically close to one seen before under the same constraints.
+    Requests are compared by cosine similarity of their embeddings; constraints must match exactly.
+    Entries are persisted to SQLite but searched in memory, grouped by constraints, so a lookup only scores
+    the plans it could actually return.
+    """
+
+    def __init__(self, path: str, embeddings: Embeddings, threshold: float = 0.90) -> None:
+        self.embeddings = embeddings
+        self.threshold = threshold
+        # Writes happen on worker threads, one at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS plans (
+                key TEXT,
+                bpm INTEGER,
+                time_signature TEXT,
+                embedding BLOB NOT NULL,
+                plan TEXT NOT NULL
+            )
+            """
+        )
+        self.db.commit()
+
+        self._entries: dict[Constraints, list[tuple[array, str]]] = {}
+        for key, bpm, time_signature, blob, plan in self.db.execute(
+            "SELECT key, bpm, time_signature, embedding, plan FROM plans"
+        ):
+            embedding = array("f")
+            embedding.frombytes(blob)
+            self._entries.setdefault((key, bpm, time_signature), []).append((embedding, plan))
+
+    async def lookup(self, user_request: str, constraints: Constraints) -> tuple[array, str | None]:
+        """Return the request's embedding along with the closest cached plan JSON, if any is similar enough."""
+        embedding = _normalize(await self.embeddings.aembed_query(user_request))
+        # Scoring is pure Python per entry, so keep it off the event loop as the cache grows
+        best_plan = await asyncio.to_thread(self._best_match, embedding, constraints)
+        return embedding, best_plan
+
+    async def store(self, embedding: array, constraints: Constraints, plan: str) -> None:
+        """Persist a plan's JSON under the embedding returned by `lookup`."""
+        self._entries.setdefault(constraints, []).append((embedding, plan))
+        await asyncio.to_thread(self._insert, embedding, constraints, plan)
+
+    def _best_match(self, embedding: array, constraints: Constraints) -> str | None:
+        best_plan: str | None = None
+        best_score = self.threshold
+        for cached, plan in self._entries.get(constraints, ()):
+            # Both vectors are unit length, so the dot product is their cosine similarity
+            score = sum(map(operator.mul, embedding, cached))
+            if score >= best_score:
+                best_plan, best_score = plan, score
+        return best_plan
+
+    def _insert(self, embedding: array, constraints: Constraints, plan: str) -> None:
+        with self._db_lock:
+            self.db.execute(
+                "INSERT INTO plans (key, bpm, time_signature, embedding, plan) VALUES (?, ?, ?, ?, ?)",
+                (*constraints, embedding.tobytes(), plan),
+            )
+            self.db.commit()
+
+
+def _normalize(vector: list[float]) -> array:
+    norm = math.hypot(*vector) or 1.0
+    return array("f", (x / norm for x in vector))
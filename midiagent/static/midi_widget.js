@@ -0,0 +1,192 @@
+function render({ model, el }) {
+    // Create container with all required elements
+    el.innerHTML = `
+        <div class="midi-widget">
+            <div class="controls">
+                <button id="enable">Enable MIDI</button>
+                <select id="outs"><option>-- select output --</option></select>
+            </div>
+        </div>
+    `;
+
+    // Get references to elements within this widget's container
+    const outsEl = el.querySelector("#outs");
+    const enableBtn = el.querySelector("#enable");
+
+    // Buffer log lines and flush them together, rather than copying the log and syncing per line
+    let pendingLog = null;
+    // Lines logged within this window go out in one sync, so the notebook's log cell re-renders once per burst
+    const LOG_FLUSH_MS = 100;
+    const flushLog = () => {
+        // One copy per flush (model.set needs a new array to see a change), then trim it in place
+        const next = (model.get("log") || []).slice();
+        for (const s of pendingLog) next.push(s);
+        const limit = model.get("log_limit");
+        if (next.length > limit) next.splice(0, next.length - limit);
+        model.set("log", next);
+        model.save_changes();
+        pendingLog = null;
+    };
+    const log = (s) => {
+        if (pendingLog === null) {
+            pendingLog = [];
+            setTimeout(flushLog, LOG_FLUSH_MS);
+        }
+        pendingLog.push(s);
+    };
+
+    const EVENT_SIZE = 7;
+
+    let midiAccess = null;
+    let output = null;
+    // Notes left on by batches that have finished playing, as (channel << 8 | note), so stopping can release them
+    const activeNotes = new Set();
+
+    function fillOutputs() {
+        const outs = [...midiAccess.outputs.values()];
+        outsEl.innerHTML = outs
+            .map((o) => `<option value="${o.id}">${o.name ?? "MIDI Output"} (${o.manufacturer ?? ""})</option>`)
+            .join("");
+
+        outsEl.onchange = () => {
+            output = midiAccess.outputs.get(outsEl.value);
+            log("Selected output: " + (output?.name || "(none)"));
+        };
+
+        // auto-select first output if available
+        if (outs.length) {
+            outsEl.value = outs[0].id;
+            output = outs[0];
+            log("Selected output: " + (output?.name || "(none)"));
+        } else {
+            log("No MIDI outputs found.");
+        }
+    }
+
+    enableBtn.onclick = async () => {
+        try {
+            midiAccess = await navigator.requestMIDIAccess();
+            log("MIDI enabled.");
+            fillOutputs();
+
+            midiAccess.onstatechange = () => {
+                log("MIDI ports changed; refreshing list.");
+                fillOutputs();
+            };
+        } catch (e) {
+            log("Failed to enable MIDI: " + e);
+        }
+    };
+
+    // Batches that may still be playing, so stopping can cancel them and find the notes they left on
+    const playbacks = new Set();
+    // Latest timestamp handed to an output that can't drop queued messages; those still play after a stop
+    let scheduledUntil = 0;
+
+    // Hand over every group due within the feed window, then wake up when the next group enters it.
+    // Outputs that support MIDIOutput.clear() get the whole batch up front, since stopping can drop it there.
+    // Chromium doesn't implement clear(), so there only a window's worth is queued, as anything queued in the
+    // MIDI stack can't be cancelled.
+    function pump(playback) {
+        const { groups, startAt, output } = playback;
+        const feedAheadMs = playback.clearable ? Infinity : model.get("feed_ahead_ms");
+        const horizon = performance.now() + feedAheadMs;
+        while (playback.idx < groups.length && startAt + groups[playback.idx].timeMs <= horizon) {
+            const { timeMs, data } = groups[playback.idx++];
+            output.send(data, startAt + timeMs);
+            if (!playback.clearable) scheduledUntil = Math.max(scheduledUntil, startAt + timeMs);
+        }
+        if (playback.idx < groups.length) {
+            const wakeIn = startAt + groups[playback.idx].timeMs - feedAheadMs - performance.now();
+            playback.timer = setTimeout(() => pump(playback), Math.max(0, wakeIn));
+        }
+    }
+
+    // Apply the note ons and offs of every group `playback` has handed over that is due by `until` to `notes`
+    function trackNotes(playback, until, notes) {
+        const { groups, startAt } = playback;
+        for (let i = 0; i < playback.idx && startAt + groups[i].timeMs <= until; i++) {
+            const { data } = groups[i];
+            for (let j = 0; j < data.length; j += 3) {
+                const note = ((data[j] & 0x0f) << 8) | data[j + 1];
+                if ((data[j] & 0xf0) === 0x90 && data[j + 2] > 0) {
+                    notes.add(note);
+                } else if ((data[j] & 0xf0) === 0x80 || (data[j] & 0xf0) === 0x90) {
+                    notes.delete(note);
+                }
+            }
+        }
+    }
+
+    // Play each new batch, timing it against the MIDI stack's clock rather than JS timers
+    model.on("change:trigger", () => {
+        // Packed little-endian (status u8, data1 u8, data2 u8, time_ms u32) records
+        const view = model.get("events");
+        if (!view || view.byteLength === 0) return;
+
+        log(`Received ${view.byteLength / EVENT_SIZE} MIDI event(s)`);
+
+        if (!output) {
+            log("No MIDI output selected.");
+            return;
+        }
+
+        // Events arrive sorted by time, so each run of equal timestamps (e.g. a chord) becomes one send
+        const groups = [];
+        for (let i = 0; i < view.byteLength; i += EVENT_SIZE) {
+            const statusByte = view.getUint8(i);
+            const dataByte1 = view.getUint8(i + 1);
+            const dataByte2 = view.getUint8(i + 2);
+            const timeMs = view.getUint32(i + 3, true);
+            if (!groups.length || groups[groups.length - 1].timeMs !== timeMs) {
+                groups.push({ timeMs, data: [] });
+            }
+            groups[groups.length - 1].data.push(statusByte, dataByte1, dataByte2);
+            log(`Scheduled MIDI: [${statusByte}, ${dataByte1}, ${dataByte2}] at +${timeMs}ms`);
+        }
+
+        // Fold batches that have finished playing into activeNotes, so playbacks only holds live ones
+        const now = performance.now();
+        for (const p of playbacks) {
+            if (p.idx === p.groups.length && p.startAt + p.groups[p.groups.length - 1].timeMs <= now) {
+                trackNotes(p, Infinity, activeNotes);
+                playbacks.delete(p);
+            }
+        }
+
+        // Lookahead leaves time to hand over the first group before it is due
+        const playback = {
+            groups,
+            output,
+            clearable: typeof output.clear === "function",
+            startAt: now + model.get("lookahead_ms"),
+            idx: 0,
+            timer: null,
+        };
+        playbacks.add(playback);
+        pump(playback);
+    });
+
+    // Halt playback: cancel every group not yet handed to the MIDI stack, then release anything left sounding
+    model.on("change:stop", () => {
+        const now = performance.now();
+        for (const playback of playbacks) {
+            clearTimeout(playback.timer);
+            // Where the output can drop queued messages only what has already played counts; elsewhere
+            // everything handed over still plays
+            trackNotes(playback, playback.clearable ? now : Infinity, activeNotes);
+        }
+        playbacks.clear();
+        midiAccess?.outputs.forEach((o) => o.clear?.());
+        if (output) {
+            // Timestamped after anything that couldn't be dropped, so nothing queued turns a note back on
+            const releaseAt = Math.max(now, scheduledUntil);
+            for (const n of activeNotes) {
+                output.send([0x80 | (n >> 8), n & 0xff, 0], releaseAt);
+            }
+            log(`Stopped playback; released ${activeNotes.size} note(s)`);
+        }
+        activeNotes.clear();
+    });
+}
+export default { render };
@@ -1,50 +1,43 @@
 import marimo
 
-from midiagent.midi_playback import play_midi
-
 __generated_with = "0.18.4"
 app = marimo.App(width="medium", app_title="midi-agent")
 
-
-@app.cell
-def _():
+with app.setup:
     import marimo
 
+    from midiagent.ai import DslResponse, PipelineState, PlanResponse, debug_thread_id, stream_pipeline
+    from midiagent.constants import BPMS, KEYS, NOTE_OPTIONS, TIME_SIGNATURES
+    from midiagent.midi_playback import play_midi
     from midiagent.midi_widget import MidiWidget
 
-    midi = marimo.ui.anywidget(MidiWidget())
 
-    # Note options: C4 through C5
-    note_options = {
-        "C4": 60, "D4": 62, "E4": 64, "F4": 65,
-        "G4": 67, "A4": 69, "B4": 71, "C5": 72
-    }
+@app.cell
+def _():
+    midi = marimo.ui.anywidget(MidiWidget())
 
-    note_dropdown = marimo.ui.dropdown(
-        options=note_options,
-        value="C4",
-        label="Note"
-    )
+    note_dropdown = marimo.ui.dropdown(options=NOTE_OPTIONS, value="C4", label="Note")
 
     def send_note(_: None) -> None:
-        midi.events = [(0x90, note_dropdown.value, 100)]
+        midi.send_events([(0x90, note_dropdown.value, 100, 0.0)])
 
     send_note_btn = marimo.ui.button(label="Send Note", on_click=send_note)
+    stop_btn = marimo.ui.button(label="Stop", on_click=lambda _: midi.stop_playback())
 
-    marimo.vstack([midi, marimo.hstack([note_dropdown, send_note_btn])])
-    return marimo, midi
+    marimo.vstack([midi, marimo.hstack([note_dropdown, send_note_btn, stop_btn])])
+    return (midi,)
 
 
 @app.cell
-def _(marimo, midi):
+def _(midi):
     # Separate cell for log display - re-renders when widget changes
-    _log_text = "\n".join(midi.log) if midi.log else "(no log messages)"
+    _log_text = "\n".join(midi.log[-midi.log_limit :]) if midi.log else "(no log messages)"
     marimo.md(f"```\n{_log_text}\n```")
     return
 
 
 @app.cell
-def _(marimo):
+def _():
     # Create state for constraint values that can be updated by the LLM
     get_key, set_key = marimo.state(None)
     get_time_signature, set_time_signature = marimo.state(None)
@@ -67,13 +60,10 @@ def _(
     get_bpm,
     get_key,
     get_time_signature,
-    marimo,
     set_bpm,
     set_key,
     set_time_signature,
 ):
-    from midiagent.constants import KEYS, TIME_SIGNATURES
-
     key = marimo.ui.dropdown(
         options=KEYS,
         value=get_key(),
@@ -93,7 +83,7 @@ def _(
     )
 
     bpm = marimo.ui.dropdown(
-        options=[n for n in range(30, 361)],
+        options=BPMS,
         value=get_bpm(),
         label="BPM",
         allow_select_none=True,
@@ -110,7 +100,6 @@ def chat(
     bpm,
     get_dsl_str,
     key,
-    marimo,
     midi,
     set_bpm,
     set_dsl_str,
@@ -118,14 +107,13 @@ def chat(
     set_time_signature,
     time_signature,
 ):
-    from midiagent.ai import DslResponse, PlanResponse, PipelineState, pipeline
-    from midiagent.constants import MIDI_EVENT_TO_HEX
-    from midiagent.midi_playback import play_midi
+    # Set PIPELINE_DEBUG to checkpoint every turn of this conversation under one thread for inspection
+    thread_id = debug_thread_id()
 
-    def get_response(
+    async def get_response(
         messages: list[marimo.ai.ChatMessage],
         config: marimo.ai.ChatModelConfig,
-    ) -> tuple[PlanResponse, DslResponse]:
+    ):
         """Chat handler that uses config for constraints."""
         # Get the latest user message
         user_request = messages[-1].content if messages else ""
@@ -141,28 +129,32 @@ def chat(
         }
 
         # Run the pipeline - constraints are now in state
-        result = pipeline.invoke(
-            initial_state,
-            config={"configurable": {"thread_id": "1"}},
-        )
-
-        # Extract outputs
-        plan: PlanResponse = result["plan"]
-        response: DslResponse = result["response"]
-
-        # Update notebook state using mo.state setters
-        set_key(plan.key)
-        set_time_signature(plan.time_signature)
-        set_bpm(plan.bpm)
-        # set_dsl_str("\n".join([f"{event.measure}-{event.beat}-{event.beat_div4}-{event.beat_div16} {event.event}: {event.value}" for event in response.get_midi_events()]))
-        set_dsl_str("\n".join([
-            f"{event.measure or 'X'}-{event.beat or 'X'}-{event.beat_div4 or 'X'}-{event.beat_div16 or 'X'} {event.event}: {event.value}"
-            for event in response.dsl
-        ]))
-
-        play_midi(plan.bpm, plan.time_signature, response.get_midi_events(), midi)
-
-        return plan.reasoning
+        plan: PlanResponse | None = None
+        response: DslResponse | None = None
+        streamed = False
+        async for update in stream_pipeline(initial_state, thread_id=thread_id):
+            if isinstance(update, PlanResponse):
+                plan = update
+                # Update notebook state using mo.state setters
+                set_key(plan.key)
+                set_time_signature(plan.time_signature)
+                set_bpm(plan.bpm)
+                yield plan.reasoning
+            elif isinstance(update, DslResponse):
+                response = update
+            else:
+                # State setters only apply once the handler returns, so the DSL streams into the chat as text
+                yield ("\n" if streamed else "\n\n```\n") + DslResponse(dsl=update).format_dsl()
+                streamed = True
+
+        if streamed:
+            yield "\n```"
+        if plan and response:
+            # A memoized response arrives whole, with nothing streamed before it
+            if not streamed:
+                yield f"\n\n```\n{response.format_dsl()}\n```"
+            set_dsl_str(response.format_dsl())
+            play_midi(plan.bpm, plan.time_signature, response, midi)
 
     dsl = marimo.plain_text(get_dsl_str())
 
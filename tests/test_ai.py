@@ -0,0 +1,199 @@
+import itertools
+import random
+import unittest
+
+import msgspec
+
+from midiagent.ai import DslResponse, MidiEvent, SparseMidiEvent, _DslEventScanner, _rebase_segment
+from midiagent.constants import MIDI_EVENT_TO_HEX, TIME_SIGNATURE_BEATS_PER_MEASURE, TIME_SIGNATURES
+
+EVENT_TYPES = list(MIDI_EVENT_TO_HEX)
+
+
+def random_dsl(rng: random.Random, length: int, max_measure: int = 5) -> list[SparseMidiEvent]:
+    """Random but valid DSL, leaving timing fields unset often enough to exercise carry-over."""
+
+    def timing(high: int) -> int | None:
+        return rng.choice([None, None, None, *range(1, high + 1)])
+
+    return [
+        SparseMidiEvent(
+            measure=timing(max_measure),
+            beat=timing(8),
+            beat_div4=timing(8),
+            beat_div16=timing(8),
+            event=rng.choice(EVENT_TYPES),
+            value=rng.randint(0, 100),
+        )
+        for _ in range(length)
+    ]
+
+
+def reference_midi_events(dsl: list[SparseMidiEvent]) -> list[MidiEvent]:
+    """The original, straightforward resolution of sparse timings that `get_midi_events` must keep matching."""
+    result = []
+    measure = beat = beat_div4 = beat_div16 = 1
+    for item in dsl:
+        if item.measure and item.measure != measure:
+            measure, beat, beat_div4, beat_div16 = item.measure, 1, 1, 1
+        if item.beat and item.beat != beat:
+            beat, beat_div4, beat_div16 = item.beat, 1, 1
+        if item.beat_div4 and item.beat_div4 != beat_div4:
+            beat_div4, beat_div16 = item.beat_div4, 1
+        if item.beat_div16 and item.beat_div16 != beat_div16:
+            beat_div16 = item.beat_div16
+        result.append(MidiEvent(measure, beat, beat_div4, beat_div16, item.event, item.value))
+    return result
+
+
+class GetMidiEventsTest(unittest.TestCase):
+    def test_matches_reference_on_random_dsl(self) -> None:
+        rng = random.Random(0)
+        for _ in range(2000):
+            dsl = random_dsl(rng, rng.randint(0, 30))
+            self.assertEqual(DslResponse(dsl=dsl).get_midi_events(), reference_midi_events(dsl))
+
+    def test_parent_change_resets_lower_levels(self) -> None:
+        dsl = [
+            SparseMidiEvent(measure=1, beat=2, beat_div4=3, beat_div16=4, event="C4", value=100),
+            SparseMidiEvent(beat=3, event="D4", value=100),
+            SparseMidiEvent(measure=2, event="E4", value=0),
+        ]
+        self.assertEqual(
+            DslResponse(dsl=dsl).get_midi_events(),
+            [
+                MidiEvent(1, 2, 3, 4, "C4", 100),
+                MidiEvent(1, 3, 1, 1, "D4", 100),
+                MidiEvent(2, 1, 1, 1, "E4", 0),
+            ],
+        )
+
+
+def reference_time_ms(event: MidiEvent, bpm: int, time_signature: str) -> float:
+    """The original per-level seconds formula that `get_playback_events` replaced, in milliseconds."""
+    seconds_per_beat = 60 / bpm
+    seconds_per_measure = seconds_per_beat * TIME_SIGNATURE_BEATS_PER_MEASURE[time_signature]
+    seconds = (
+        (event.measure - 1) * seconds_per_measure
+        + (event.beat - 1) * seconds_per_beat
+        + (event.beat_div4 - 1) * seconds_per_beat / 4
+        + (event.beat_div16 - 1) * seconds_per_beat / 16
+    )
+    return seconds * 1000
+
+
+class GetPlaybackEventsTest(unittest.TestCase):
+    def test_matches_reference_timing_and_bytes(self) -> None:
+        rng = random.Random(1)
+        for _ in range(300):
+            response = DslResponse(dsl=random_dsl(rng, rng.randint(0, 30)))
+            bpm = rng.randint(30, 360)
+            time_signature = rng.choice(TIME_SIGNATURES)
+            playback = response.get_playback_events(bpm, time_signature)
+            midi_events = response.get_midi_events()
+            self.assertEqual(len(playback), len(midi_events))
+            for (status, data1, data2, time_ms), event in zip(playback, midi_events, strict=True):
+                self.assertEqual((status, data1), MIDI_EVENT_TO_HEX[event.event])
+                self.assertEqual(data2, event.value)
+                self.assertAlmostEqual(time_ms, reference_time_ms(event, bpm, time_signature), places=6)
+
+    def test_known_times(self) -> None:
+        dsl = [
+            SparseMidiEvent(measure=1, event="C4", value=100),
+            SparseMidiEvent(beat=2, event="C4", value=0),
+            SparseMidiEvent(measure=2, beat_div4=3, event="Sustain", value=100),
+        ]
+        # 120 BPM in 3/4: 500 ms per beat, 1500 ms per measure
+        self.assertEqual(
+            DslResponse(dsl=dsl).get_playback_events(120, "3/4"),
+            [(0x90, 60, 100, 0.0), (0x90, 60, 0, 500.0), (0xB0, 64, 100, 1750.0)],
+        )
+
+
+class RebaseSegmentTest(unittest.TestCase):
+    def test_merged_segments_resolve_as_if_generated_alone(self) -> None:
+        rng = random.Random(2)
+        for _ in range(500):
+            # Each segment is one measure written as measure 1, as the generation prompt asks
+            segments = [random_dsl(rng, rng.randint(0, 12), max_measure=1) for _ in range(rng.randint(1, 6))]
+            merged = [event for idx, segment in enumerate(segments) for event in _rebase_segment(segment, idx)]
+            expected = [
+                MidiEvent(e.measure + idx, e.beat, e.beat_div4, e.beat_div16, e.event, e.value)
+                for idx, segment in enumerate(segments)
+                for e in reference_midi_events(segment)
+            ]
+            self.assertEqual(DslResponse(dsl=merged).get_midi_events(), expected)
+
+    def test_first_event_is_pinned(self) -> None:
+        segment = [
+            SparseMidiEvent(beat=3, event="C4", value=100),
+            SparseMidiEvent(beat_div4=2, event="C4", value=0),
+        ]
+        self.assertEqual(
+            _rebase_segment(segment, 2),
+            [
+                SparseMidiEvent(measure=3, beat=3, beat_div4=1, beat_div16=1, event="C4", value=100),
+                SparseMidiEvent(beat_div4=2, event="C4", value=0),
+            ],
+        )
+        self.assertEqual(_rebase_segment([], 2), [])
+
+    def test_streamed_pieces_match_whole_segment(self) -> None:
+        rng = random.Random(3)
+        for _ in range(200):
+            segment = random_dsl(rng, rng.randint(1, 12), max_measure=1)
+            # The scanner hands over each chunk's completed events as one piece
+            cuts = sorted(rng.sample(range(1, len(segment)), rng.randint(0, len(segment) - 1)))
+            pieces = []
+            for start, end in itertools.pairwise([0, *cuts, len(segment)]):
+                pieces += _rebase_segment(segment[start:end], 3, pin_first=not pieces)
+            self.assertEqual(pieces, _rebase_segment(segment, 3))
+
+
+def feed_in_chunks(rng: random.Random, raw: str) -> tuple[_DslEventScanner, int]:
+    """Feed `raw` to a new scanner split at random offsets, returning it and the total of its completed counts."""
+    scanner = _DslEventScanner()
+    cuts = sorted(rng.sample(range(1, len(raw)), rng.randint(0, min(len(raw) - 1, 40))))
+    completed = sum(scanner.feed(raw[start:end]) for start, end in itertools.pairwise([0, *cuts, len(raw)]))
+    return scanner, completed
+
+
+class ScannerTest(unittest.TestCase):
+    def test_random_chunk_splits(self) -> None:
+        rng = random.Random(4)
+        for _ in range(300):
+            dsl = random_dsl(rng, rng.randint(0, 20))
+            raw = msgspec.json.encode(DslResponse(dsl=dsl)).decode()
+            if rng.random() < 0.5:
+                raw = msgspec.json.format(raw, indent=rng.choice([0, 2, 4]))
+            scanner, completed = feed_in_chunks(rng, raw)
+            self.assertEqual(scanner.events, dsl)
+            self.assertEqual(completed, len(dsl))
+            self.assertEqual(scanner.raw, raw)
+
+    def test_strings_with_escapes_and_brackets(self) -> None:
+        # Brackets and escaped quotes inside strings must not move the depth, even split across chunks
+        raw = (
+            r'{"note": "a \\\" {[ \"}]\\", "dsl": '
+            r'[{"beat": 2, "event": "C\u0034", "value": 80}, {"event": "D4", "value": 0, "beat_div4": 3}]}'
+        )
+        expected = [
+            SparseMidiEvent(beat=2, event="C4", value=80),
+            SparseMidiEvent(beat_div4=3, event="D4", value=0),
+        ]
+        rng = random.Random(5)
+        for _ in range(200):
+            scanner, completed = feed_in_chunks(rng, raw)
+            self.assertEqual(scanner.events, expected)
+            self.assertEqual(completed, 2)
+
+    def test_incomplete_event_is_held_back(self) -> None:
+        scanner = _DslEventScanner()
+        self.assertEqual(scanner.feed('{"dsl": [{"event": "C4", "value": 8'), 0)
+        self.assertEqual(scanner.events, [])
+        self.assertEqual(scanner.feed('0}, {"event"'), 1)
+        self.assertEqual(scanner.events, [SparseMidiEvent(event="C4", value=80)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+import unittest
+
+from midiagent.batching import MicroBatcher
+
+REQUEST_ID = contextvars.ContextVar("REQUEST_ID", default=None)
+
+
+class RecordingBatcher:
+    """Doubles each item, recording the batches it was called with and the context each ran in."""
+
+    def __init__(self, **kwargs) -> None:
+        self.batches: list[list[int]] = []
+        self.request_ids: list[str | None] = []
+        self.batcher = MicroBatcher(self.run_batch, **kwargs)
+
+    async def run_batch(self, items: list[int]) -> list[int]:
+        self.batches.append(items)
+        self.request_ids.append(REQUEST_ID.get())
+        return [item * 2 for item in items]
+
+
+class MicroBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_submits_share_a_batch_in_order(self) -> None:
+        recorder = RecordingBatcher(max_size=8, max_wait=0.01)
+        results = await asyncio.gather(*(recorder.batcher.submit(item) for item in range(5)))
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(recorder.batches, [[0, 1, 2, 3, 4]])
+
+    async def test_batches_are_capped_at_max_size(self) -> None:
+        recorder = RecordingBatcher(max_size=3, max_wait=0.01)
+        results = await asyncio.gather(*(recorder.batcher.submit(item) for item in range(7)))
+        self.assertEqual(results, [item * 2 for item in range(7)])
+        self.assertEqual(recorder.batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    async def test_lone_item_skips_the_window(self) -> None:
+        # A window this long would time the call out if a lone item waited for it
+        recorder = RecordingBatcher(max_wait=60)
+        self.assertEqual(await asyncio.wait_for(recorder.batcher.submit(4), timeout=1), 8)
+
+    async def test_failure_reaches_every_item_in_the_batch(self) -> None:
+        error = RuntimeError("LLM call failed")
+
+        async def run_batch(items: list[int]) -> list[int]:
+            raise error
+
+        batcher = MicroBatcher(run_batch, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(item) for item in range(3)), return_exceptions=True)
+        self.assertEqual(results, [error, error, error])
+
+    async def test_wrong_number_of_results_is_an_error(self) -> None:
+        async def run_batch(items: list[int]) -> list[int]:
+            return items[1:]
+
+        batcher = MicroBatcher(run_batch, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(item) for item in range(2)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_batch_runs_in_first_callers_context(self) -> None:
+        recorder = RecordingBatcher(max_wait=0.01)
+
+        async def submit(request_id: str, item: int) -> int:
+            REQUEST_ID.set(request_id)
+            return await recorder.batcher.submit(item)
+
+        await asyncio.gather(submit("first", 1), submit("second", 2))
+        self.assertEqual(recorder.request_ids, ["first"])
+
+
+class MicroBatcherLoopTest(unittest.TestCase):
+    def test_survives_a_new_event_loop(self) -> None:
+        # Each asyncio.run starts a new loop, as happens between notebook runs
+        recorder = RecordingBatcher(max_wait=0.01)
+        self.assertEqual(asyncio.run(recorder.batcher.submit(1)), 2)
+        self.assertEqual(asyncio.run(recorder.batcher.submit(2)), 4)
+        self.assertEqual(recorder.batches, [[1], [2]])
+
+
+if __name__ == "__main__":
+    unittest.main()